@@ -0,0 +1,272 @@
+"""
+全倉、只做多的回測引擎，SMA / EMA / Alligator 的 backtest_* 都委派到這裡。
+"""
+
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from backtest._kernels import equity_stats
+from backtest._njit import NUMBA_AVAILABLE, njit, prange
+from backtest.types_trading import Trade
+
+
+def run_longonly(
+    open_: np.ndarray,
+    close: np.ndarray,
+    open_time: pd.Series,
+    entry: np.ndarray,
+    exit_: np.ndarray,
+    initial_equity: float = 10_000.0,
+    fee_rate: float = 0.001,
+    warmup: int = 0,
+) -> tuple[pd.Series, List[Trade], dict]:
+    """
+    全倉單一部位（只做多）回測：
+    - 有部位時不重複進場；同一根 K 線先處理出場再處理進場
+    - entry / exit 為每根 K 線的進出場訊號，交易在「下一根 K 線開盤價」成交
+    - 每次買 / 賣都扣單邊手續費 fee_rate
+    - warmup 之前的 K 線（指標還沒算出來）不交易
+    """
+    n = len(open_) - 1  # 最後一列沒有下一根 K 線，略過
+    # 訊號在下一根 K 線開盤價成交：直接錯開一格取 open，不另外建 next_open 欄位
+    next_open = open_[1:]
+    close = close[:n]
+
+    tradable = ~np.isnan(next_open) & (next_open > 0)
+    tradable[:warmup] = False
+
+    long_entry = entry[:n] & tradable
+    long_exit = exit_[:n] & tradable
+
+    # --- 持倉狀態：同一根 bar 先出場再進場，所以 bar 結束時是否持倉由「最後一個事件」決定 --- #
+    bars = np.arange(n)
+    last_event = np.maximum.accumulate(np.where(long_entry | long_exit, bars, 0))
+    held = long_entry[last_event]
+    held_prev = np.concatenate(([False], held[:-1]))
+
+    # 空手遇到進場訊號、或同一根 bar 出場後再進場，都是一筆新交易
+    entry_idx = np.flatnonzero(long_entry & (~held_prev | long_exit))
+    exit_idx = np.flatnonzero(held_prev & long_exit)
+
+    entry_px = next_open[entry_idx]
+    exit_px = next_open[exit_idx]
+
+    # 手續費只算一次：含費買入單價 / 扣費賣出單價
+    buy_px = entry_px * (1 + fee_rate)
+    sell_px = exit_px * (1 - fee_rate)
+
+    # 每筆交易的淨報酬（含進出場雙邊手續費），全倉滾動 → 每筆交易邊界的權益
+    gross = sell_px / buy_px[: len(exit_idx)]
+    boundary_equity = initial_equity * np.concatenate(([1.0], np.cumprod(gross)))
+    size = boundary_equity[: len(entry_idx)] / buy_px
+
+    # --- 每個 bar 計算 MTM（市值）：持倉中 = size * close，空手 = 上一筆交易結束後的權益 --- #
+    trade_id = np.searchsorted(entry_idx, bars, side="right") - 1
+    closed = np.searchsorted(exit_idx, bars, side="right")
+    equity_curve = boundary_equity[closed]
+    equity_curve[held] = size[trade_id[held]] * close[held]
+
+    open_time = open_time.iloc[:n]
+    times = open_time.array  # 直接取底層陣列，避免每筆交易都走 Series.iloc
+    trades: List[Trade] = [
+        Trade(
+            entry_time=times[e],
+            exit_time=times[x],
+            entry_price=float(entry_px[k]),
+            exit_price=float(exit_px[k]),
+            pnl=float(boundary_equity[k + 1]),
+            ret=float(gross[k] - 1.0),
+        )
+        for k, (e, x) in enumerate(zip(entry_idx, exit_idx))
+    ]
+
+    equity_series = pd.Series(equity_curve, index=open_time)
+
+    # 績效指標（報酬、回撤、Sharpe 一次算完）
+    total_return, max_dd, sharpe = equity_stats(equity_curve, initial_equity)
+
+    stats = {
+        "initial_equity": initial_equity,
+        "final_equity": float(equity_curve[-1]),
+        "total_return": float(total_return),
+        "max_drawdown": float(max_dd),
+        "sharpe_approx": float(sharpe),
+        "num_trades": len(trades),
+    }
+
+    return equity_series, trades, stats
+
+
+@njit(parallel=True, cache=True)
+def _longonly_grid_kernel(
+    open_: np.ndarray,
+    close: np.ndarray,
+    entries: np.ndarray,
+    exits: np.ndarray,
+    initial_equity: float,
+    fee_rate: float,
+    warmup: int,
+    periods_per_year: float,
+):
+    """
+    每一欄訊號各自跑一次 run_longonly 的逐根狀態機，欄與欄之間用 prange 平行。
+    只累積績效指標，不建權益曲線與交易紀錄。
+    """
+    n = open_.shape[0] - 1
+    n_cols = entries.shape[1]
+    final_equity = np.empty(n_cols)
+    max_drawdown = np.empty(n_cols)
+    sharpe = np.empty(n_cols)
+    num_trades = np.zeros(n_cols, np.int64)
+
+    for k in prange(n_cols):
+        cash = initial_equity
+        size = 0.0
+        holding = False
+        prev_eq = initial_equity
+        running_max = initial_equity
+        max_dd = 0.0
+        mean = 0.0
+        m2 = 0.0
+        trades = 0
+
+        # 第一個能成交的進場訊號之前一直空手：權益不變、報酬全為 0，直接跳過。
+        # 全 0 報酬下 Welford 的 mean / m2 仍是 0，結果與從第 0 根跑起完全相同
+        start = warmup
+        while start < n and not (entries[start, k] and open_[start + 1] > 0):
+            start += 1
+
+        for i in range(start, n):
+            px = open_[i + 1]
+            if i >= warmup and px > 0:  # px 為 NaN 時比較結果為 False
+                if holding and exits[i, k]:
+                    cash = size * (px * (1 - fee_rate))
+                    size = 0.0
+                    holding = False
+                    trades += 1
+                if not holding and entries[i, k]:
+                    size = cash / (px * (1 + fee_rate))
+                    cash = 0.0
+                    holding = True
+
+            eq = size * close[i] if holding else cash
+
+            if i == 0:
+                running_max = eq
+            if eq > running_max:
+                running_max = eq
+            dd = eq / running_max - 1.0
+            if dd < max_dd:
+                max_dd = dd
+
+            # Welford 線上平均 / 變異數，第一根報酬為 0
+            r = eq / prev_eq - 1.0 if i > 0 else 0.0
+            delta = r - mean
+            mean += delta / (i + 1)
+            m2 += delta * (r - mean)
+            prev_eq = eq
+
+        std = np.sqrt(m2 / n)
+        final_equity[k] = prev_eq
+        max_drawdown[k] = max_dd
+        sharpe[k] = mean / std * np.sqrt(periods_per_year) if std > 0 else 0.0
+        num_trades[k] = trades
+
+    return final_equity, max_drawdown, sharpe, num_trades
+
+
+def _longonly_grid_np(
+    open_: np.ndarray,
+    close: np.ndarray,
+    entries: np.ndarray,
+    exits: np.ndarray,
+    initial_equity: float,
+    fee_rate: float,
+    warmup: int,
+    periods_per_year: float,
+):
+    """
+    _longonly_grid_kernel 的 NumPy 版本（沒有 Numba 時使用）：所有組合攤成 (K 線數, 組數) 的矩陣一起算。
+    持倉狀態 = 最近一次進出場事件往後填；每根 K 線的權益變化倍數由「續抱 / 賣出 / 買進」三種情況相乘，
+    cumprod 得到每一欄的權益曲線，最後沿 axis=0 一次算完績效指標。
+    """
+    n = open_.shape[0] - 1
+    n_cols = entries.shape[1]
+    px = open_[1:n + 1, None]
+    close_now = close[:n, None]
+    close_prev = np.concatenate(([np.nan], close[:n - 1]))[:, None]
+
+    # 暖身期或下一根開盤價不合法時不交易（同 kernel 的 px > 0 條件，NaN 也視為不合法）
+    tradable = (np.arange(n) >= warmup) & (open_[1:n + 1] > 0)
+    entry = entries[:n] & tradable[:, None]
+    exit_ = exits[:n] & tradable[:, None]
+
+    # 處理完第 i 根後是否持倉：有進場訊號必定持倉，否則維持前一根、遇到出場才空手
+    bars = np.arange(1, n + 1)[:, None]
+    last_event = np.maximum.accumulate(np.where(entry | exit_, bars, 0), axis=0)
+    held = np.vstack((np.zeros((1, n_cols), dtype=bool), entry))
+    held = np.take_along_axis(held, last_event, axis=0)
+    held_prev = np.vstack((np.zeros((1, n_cols), dtype=bool), held[:-1]))
+
+    sold = held_prev & exit_
+    bought = entry & (~held_prev | exit_)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        growth = np.where(held_prev & ~sold, close_now / close_prev, 1.0)
+        growth *= np.where(sold, px * (1 - fee_rate) / close_prev, 1.0)
+        growth *= np.where(bought, close_now / (px * (1 + fee_rate)), 1.0)
+    eq = initial_equity * np.cumprod(growth, axis=0)
+
+    ret = np.zeros_like(eq)
+    ret[1:] = eq[1:] / eq[:-1] - 1.0
+    std = ret.std(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        sharpe = np.where(std > 0, ret.mean(axis=0) / std * np.sqrt(periods_per_year), 0.0)
+
+    final_equity = eq[-1]
+    max_drawdown = np.minimum((eq / np.maximum.accumulate(eq, axis=0) - 1.0).min(axis=0), 0.0)
+    num_trades = sold.sum(axis=0)
+    return final_equity, max_drawdown, sharpe, num_trades
+
+
+# 有 Numba 用平行的逐根 kernel，否則用矩陣化的 NumPy 版本（純 Python 迴圈會比較慢）
+_longonly_grid = _longonly_grid_kernel if NUMBA_AVAILABLE else _longonly_grid_np
+
+
+def run_longonly_grid(
+    open_: np.ndarray,
+    close: np.ndarray,
+    entries: np.ndarray,
+    exits: np.ndarray,
+    initial_equity: float = 10_000.0,
+    fee_rate: float = 0.001,
+    warmup: int = 0,
+) -> list[dict]:
+    """
+    一次回測多組訊號：entries / exits 為 (K 線數, 組數) 的 bool 矩陣，每一欄是一組參數。
+    規則與 run_longonly 相同，回傳與欄位同順序的 stats（格式同 run_longonly）。
+    """
+    final_equity, max_drawdown, sharpe, num_trades = _longonly_grid(
+        np.ascontiguousarray(open_, dtype=np.float64),
+        np.ascontiguousarray(close, dtype=np.float64),
+        entries,
+        exits,
+        initial_equity,
+        fee_rate,
+        warmup,
+        252 * 24,
+    )
+
+    return [
+        {
+            "initial_equity": initial_equity,
+            "final_equity": float(final_equity[k]),
+            "total_return": float(final_equity[k] / initial_equity - 1.0),
+            "max_drawdown": float(max_drawdown[k]),
+            "sharpe_approx": float(sharpe[k]),
+            "num_trades": int(num_trades[k]),
+        }
+        for k in range(entries.shape[1])
+    ]
@@ -0,0 +1,153 @@
+"""
+回測共用的數值 kernel（Numba 編譯，沒裝 Numba 時以純 Python 執行）。
+"""
+
+import numpy as np
+
+from backtest._njit import NUMBA_AVAILABLE, njit
+
+
+@njit(cache=True, fastmath=True)
+def ewma(x: np.ndarray, alpha: float) -> np.ndarray:
+    """
+    一階指數加權平均，等同 pandas ewm(alpha=alpha, adjust=False).mean()。
+    """
+    n = x.shape[0]
+    out = np.empty(n)
+    if n == 0:
+        return out
+
+    s = x[0]
+    out[0] = s
+    for i in range(1, n):
+        s = alpha * x[i] + (1.0 - alpha) * s
+        out[i] = s
+    return out
+
+
+@njit(cache=True)
+def alligator_lines(price: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    一次迴圈同時算出 Alligator 三條線（已右移），取代三次 ewm + 三次 shift：
+    - jaw   : 13 期 SMMA, 右移 8 根
+    - teeth : 8 期 SMMA, 右移 5 根
+    - lips  : 5 期 SMMA, 右移 3 根
+    """
+    n = price.shape[0]
+    jaw = np.full(n, np.nan)
+    teeth = np.full(n, np.nan)
+    lips = np.full(n, np.nan)
+    if n == 0:
+        return jaw, teeth, lips
+
+    a13 = 1.0 / 13
+    a8 = 1.0 / 8
+    a5 = 1.0 / 5
+    s13 = price[0]
+    s8 = price[0]
+    s5 = price[0]
+    for i in range(n):
+        if i > 0:
+            s13 = a13 * price[i] + (1.0 - a13) * s13
+            s8 = a8 * price[i] + (1.0 - a8) * s8
+            s5 = a5 * price[i] + (1.0 - a5) * s5
+        if i + 8 < n:
+            jaw[i + 8] = s13
+        if i + 5 < n:
+            teeth[i + 5] = s8
+        if i + 3 < n:
+            lips[i + 3] = s5
+    return jaw, teeth, lips
+
+
+@njit(cache=True)
+def _equity_stats_nb(
+    eq: np.ndarray,
+    initial_equity: float,
+    periods_per_year: float = 252 * 24,
+) -> tuple[float, float, float]:
+    """
+    一次走過權益曲線，同時算出 (total_return, max_drawdown, sharpe_approx)：
+    - 報酬序列為 pct_change（第一根記 0），標準差用 ddof=0
+    - sharpe 預設假設 1 天 24 根 bar、252 交易日
+    """
+    n = eq.shape[0]
+    running_max = eq[0]
+    max_dd = 0.0
+    # Welford 線上平均 / 變異數，第一根報酬為 0
+    mean = 0.0
+    m2 = 0.0
+    for i in range(n):
+        if eq[i] > running_max:
+            running_max = eq[i]
+        dd = eq[i] / running_max - 1.0
+        if dd < max_dd:
+            max_dd = dd
+
+        r = eq[i] / eq[i - 1] - 1.0 if i > 0 else 0.0
+        delta = r - mean
+        mean += delta / (i + 1)
+        m2 += delta * (r - mean)
+
+    total_return = eq[n - 1] / initial_equity - 1.0
+    std = np.sqrt(m2 / n)
+    sharpe = 0.0
+    if std > 0:
+        sharpe = mean / std * np.sqrt(periods_per_year)
+    return total_return, max_dd, sharpe
+
+
+def _equity_stats_np(
+    eq: np.ndarray,
+    initial_equity: float,
+    periods_per_year: float = 252 * 24,
+) -> tuple[float, float, float]:
+    """
+    _equity_stats_nb 的 NumPy 向量化版本（沒有 Numba 時使用），直接在陣列上算，不建 pandas Series。
+    """
+    ret = np.empty_like(eq)
+    ret[0] = 0.0
+    ret[1:] = eq[1:] / eq[:-1] - 1.0
+
+    max_dd = float((eq / np.maximum.accumulate(eq) - 1.0).min())
+    total_return = float(eq[-1] / initial_equity - 1.0)
+
+    std = ret.std()
+    sharpe = float(ret.mean() / std * np.sqrt(periods_per_year)) if std > 0 else 0.0
+    return total_return, max_dd, sharpe
+
+
+# 有 Numba 用單次迴圈的版本，否則用向量化版本（純 Python 迴圈會比較慢）
+equity_stats = _equity_stats_nb if NUMBA_AVAILABLE else _equity_stats_np
+
+
+def rolling_mean(x: np.ndarray, n: int) -> np.ndarray:
+    """
+    n 期簡單移動平均，等同 rolling(n, min_periods=n).mean()。
+    用累積和相減一次算完所有視窗，前 n-1 根補 NaN。
+    """
+    out = np.full(x.shape[0], np.nan)
+    if x.shape[0] < n:
+        return out
+
+    c = np.concatenate(([0.0], np.cumsum(x, dtype=np.float64)))
+    out[n - 1:] = (c[n:] - c[:-n]) / n
+    return out
+
+
+def cross_signals(fast: np.ndarray, slow: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    fast / slow 兩條線的交叉訊號（不建立 shift 後的 _prev 欄位）：
+    - 黃金交叉：前一根 fast <= slow，這一根 fast > slow
+    - 死亡交叉：前一根 fast >= slow，這一根 fast < slow
+    前一根有 NaN（指標暖機期）時不算交叉。
+    """
+    gt = fast > slow
+    lt = fast < slow
+    prev_valid = ~(np.isnan(fast[:-1]) | np.isnan(slow[:-1]))
+
+    signal_long = np.zeros(fast.shape[0], dtype=bool)
+    signal_exit = np.zeros(fast.shape[0], dtype=bool)
+    signal_long[1:] = gt[1:] & ~gt[:-1] & prev_valid
+    signal_exit[1:] = lt[1:] & ~lt[:-1] & prev_valid
+    return signal_long, signal_exit
@@ -0,0 +1,17 @@
+"""
+Numba 是選用套件：沒有安裝時 njit 會退化成什麼都不做的 decorator，
+被裝飾的函式就以純 Python 執行（結果相同，只是比較慢）。
+"""
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        # 支援 @njit 與 @njit(cache=True) 兩種寫法
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+        return lambda f: f
@@ -2,33 +2,118 @@ from typing import List
 import numpy as np
 import pandas as pd
 
+from backtest._engine import run_longonly
+from backtest._kernels import alligator_lines, ewma
+from backtest._njit import NUMBA_AVAILABLE, njit
 from backtest.types_trading import Trade
 
 def smma(series: pd.Series, period: int) -> pd.Series:
     """
     近似 Bill Williams 的 SMMA (平滑移動平均)
-    用 EWM(alpha=1/period) 來實作，速度較快。
+    等同 EWM(alpha=1/period, adjust=False)，用 Numba 編譯的 ewma kernel 計算。
     """
-    return series.ewm(alpha=1/period, adjust=False).mean()
+    return pd.Series(ewma(series.to_numpy(dtype=np.float64), 1.0 / period), index=series.index)
 
-def add_alligator(df: pd.DataFrame) -> pd.DataFrame:
+def alligator_columns(df: pd.DataFrame) -> dict[str, np.ndarray]:
     """
-    在 DataFrame 上加上 Alligator 三條線：
+    計算 Alligator 三條線，回傳 {欄位名稱: 陣列}，不修改 df：
     - jaw   (下顎)  : 13 期 SMMA, 右移 8 根
     - teeth (牙齒)  : 8 期 SMMA, 右移 5 根
     - lips  (嘴唇)  : 5 期 SMMA, 右移 3 根
 
     假設 df 至少有欄位: ["high", "low"]
+    三條線由 alligator_lines 在同一個迴圈內算完。
     """
-    price = (df["high"] + df["low"]) / 2.0
+    price = (df["high"].to_numpy(dtype=np.float64) + df["low"].to_numpy(dtype=np.float64)) * 0.5
 
-    df["jaw"] = smma(price, 13).shift(8)
-    df["teeth"] = smma(price, 8).shift(5)
-    df["lips"] = smma(price, 5).shift(3)
-    
-    df["next_open"] = df["open"].shift(-1)
+    jaw, teeth, lips = alligator_lines(price)
 
-    return df
+    return {
+        "jaw": jaw,
+        "teeth": teeth,
+        "lips": lips,
+    }
+
+@njit(cache=True)
+def _alligator_position_loop(
+    long_entry: np.ndarray,
+    short_entry: np.ndarray,
+    long_exit: np.ndarray,
+    short_exit: np.ndarray,
+) -> np.ndarray:
+    """
+    逐根 K 線推進部位狀態（1 = 多頭, -1 = 空頭, 0 = 空手）。
+    部位取決於前一根的部位，無法直接向量化，所以用 Numba 編譯這個迴圈。
+    """
+    n = long_entry.shape[0]
+    out = np.empty(n, np.int8)
+    current_pos = 0  # 1 = long, -1 = short, 0 = flat
+
+    for i in range(n):
+        if current_pos == 0:
+            # 沒部位時，優先進多；如果你想多空同等，可以加條件選擇
+            if long_entry[i]:
+                current_pos = 1
+            elif short_entry[i]:
+                current_pos = -1
+
+        elif current_pos == 1:
+            # 有多單時，遇到 long_exit 就平倉；可選擇同時 short_entry 時反手
+            if long_exit[i]:
+                current_pos = 0
+                # 如果想反手就寫：
+                # if short_entry[i]:
+                #     current_pos = -1
+
+        elif current_pos == -1:
+            # 有空單時
+            if short_exit[i]:
+                current_pos = 0
+                # 如果想反手就寫：
+                # if long_entry[i]:
+                #     current_pos = 1
+
+        out[i] = current_pos
+
+    return out
+
+def _alligator_position_vec(
+    long_entry: np.ndarray,
+    short_entry: np.ndarray,
+    long_exit: np.ndarray,
+    short_exit: np.ndarray,
+) -> np.ndarray:
+    """
+    與 _alligator_position_loop 結果相同的 NumPy 版本，沒有 Numba 時使用。
+    只在「每筆交易」之間跳躍（searchsorted 找下一個進場 / 出場），
+    持倉區間用切片一次填滿，不逐根 K 線跑 Python 迴圈。
+    """
+    n = long_entry.shape[0]
+    position = np.zeros(n, np.int8)
+
+    # 空手時的進場方向：多單優先
+    raw = np.where(long_entry, 1, np.where(short_entry, -1, 0)).astype(np.int8)
+    entry_idx = np.flatnonzero(raw)
+    long_exit_idx = np.flatnonzero(long_exit)
+    short_exit_idx = np.flatnonzero(short_exit)
+
+    start = 0
+    while True:
+        k = np.searchsorted(entry_idx, start)
+        if k == len(entry_idx):
+            break
+        e = entry_idx[k]
+        side = raw[e]
+
+        # 進場那根之後第一個同方向出場訊號；該根 K 線部位歸零，下一根才可能再進場
+        exits = long_exit_idx if side == 1 else short_exit_idx
+        j = np.searchsorted(exits, e, side="right")
+        x = exits[j] if j < len(exits) else n
+
+        position[e:x] = side
+        start = x + 1
+
+    return position
 
 def compute_signals(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -41,84 +126,73 @@ def compute_signals(df: pd.DataFrame) -> pd.DataFrame:
       - long_exit, short_exit
       - position  (1 = 多頭, -1 = 空頭, 0 = 空手)
     """
-    df = df.copy()
-    df = add_alligator(df)
+    cols = alligator_columns(df)
+
+    close = df["close"].to_numpy(dtype=np.float64)
+    jaw = cols["jaw"]
+    teeth = cols["teeth"]
+    lips = cols["lips"]
 
     # --- 多空趨勢結構判斷 --- #
-    long_trend = (df["lips"] > df["teeth"]) & (df["teeth"] > df["jaw"])
-    short_trend = (df["lips"] < df["teeth"]) & (df["teeth"] < df["jaw"])
+    long_trend = (lips > teeth) & (teeth > jaw)
+    short_trend = (lips < teeth) & (teeth < jaw)
+
+    # 前一根的趨勢結構（第一根視為沒有趨勢）
+    prev_long_trend = np.concatenate(([False], long_trend[:-1]))
+    prev_short_trend = np.concatenate(([False], short_trend[:-1]))
 
     # 斜率方向（簡單用前一根比較）
-    long_slope = (
-        (df["lips"] > df["lips"].shift(1)) &
-        (df["teeth"] > df["teeth"].shift(1)) &
-        (df["jaw"] > df["jaw"].shift(1))
+    long_slope = np.zeros(len(df), dtype=bool)
+    short_slope = np.zeros(len(df), dtype=bool)
+    long_slope[1:] = (
+        (lips[1:] > lips[:-1]) &
+        (teeth[1:] > teeth[:-1]) &
+        (jaw[1:] > jaw[:-1])
     )
-    short_slope = (
-        (df["lips"] < df["lips"].shift(1)) &
-        (df["teeth"] < df["teeth"].shift(1)) &
-        (df["jaw"] < df["jaw"].shift(1))
+    short_slope[1:] = (
+        (lips[1:] < lips[:-1]) &
+        (teeth[1:] < teeth[:-1]) &
+        (jaw[1:] < jaw[:-1])
     )
 
     # --- 進場訊號 --- #
-    df["long_entry"] = (
+    cols["long_entry"] = (
         long_trend &
         long_slope &
-        (df["close"] > df["lips"]) &
-        (~long_trend.shift(1).fillna(False))
+        (close > lips) &
+        ~prev_long_trend
     )
 
-    df["short_entry"] = (
+    cols["short_entry"] = (
         short_trend &
         short_slope &
-        (df["close"] < df["lips"]) &
-        (~short_trend.shift(1).fillna(False))
+        (close < lips) &
+        ~prev_short_trend
     )
 
     # --- 出場訊號 --- #
-    df["long_exit"] = (
-        (df["close"] < df["jaw"]) |  # 跌破下顎
-        (df["lips"] <= df["teeth"])  # 嘴唇不再領先牙齒，結構壞掉
+    cols["long_exit"] = (
+        (close < jaw) |  # 跌破下顎
+        (lips <= teeth)  # 嘴唇不再領先牙齒，結構壞掉
     )
 
-    df["short_exit"] = (
-        (df["close"] > df["jaw"]) |  # 突破下顎
-        (df["lips"] >= df["teeth"])
+    cols["short_exit"] = (
+        (close > jaw) |  # 突破下顎
+        (lips >= teeth)
     )
 
     # --- 根據訊號產生 position（單一部位，非多空同時持有） --- #
-    position = []
-    current_pos = 0  # 1 = long, -1 = short, 0 = flat
-
-    for i in range(len(df)):
-        if current_pos == 0:
-            # 沒部位時，優先進多；如果你想多空同等，可以加條件選擇
-            if df["long_entry"].iloc[i]:
-                current_pos = 1
-            elif df["short_entry"].iloc[i]:
-                current_pos = -1
-
-        elif current_pos == 1:
-            # 有多單時，遇到 long_exit 就平倉；可選擇同時 short_entry 時反手
-            if df["long_exit"].iloc[i]:
-                current_pos = 0
-                # 如果想反手就寫：
-                # if df["short_entry"].iloc[i]:
-                #     current_pos = -1
-
-        elif current_pos == -1:
-            # 有空單時
-            if df["short_exit"].iloc[i]:
-                current_pos = 0
-                # 如果想反手就寫：
-                # if df["long_entry"].iloc[i]:
-                #     current_pos = 1
-
-        position.append(current_pos)
-
-    df["position"] = position
+    # 有 Numba 用編譯過的逐根迴圈，否則用逐筆交易的 NumPy 版本
+    position_fn = _alligator_position_loop if NUMBA_AVAILABLE else _alligator_position_vec
+    cols["position"] = position_fn(
+        cols["long_entry"],
+        cols["short_entry"],
+        cols["long_exit"],
+        cols["short_exit"],
+    )
 
-    return df
+    # 新欄位最後用一次 assign 接上，整個流程只複製 df 一次
+    return df.assign(**cols)
 
 # from types_trading import Trade  # 你共用的 Trade dataclass
 
@@ -135,96 +209,23 @@ def backtest_alligator(
     - 交易在「下一根 K 線開盤價」成交
     - 每次買 / 賣都扣單邊手續費 fee_rate
     """
-    equity = initial_equity
-    equity_curve = []
-
-    position = 0.0         # 持有標的數量（例如 XRP 數量）
-    entry_price = None
-    entry_time = None
-    trades: List[Trade] = []
-
-    for i in range(len(df_sig) - 1):  # 最後一列沒有 next_open，略過
-        row = df_sig.iloc[i]
-
-        # 還沒有 Alligator 值的前期資料，跳過交易邏輯
-        if pd.isna(row["jaw"]) or pd.isna(row["teeth"]) or pd.isna(row["lips"]):
-            equity_curve.append(equity if position == 0 else equity + position * row["close"])
-            continue
-
-        px_next_open = float(row["next_open"])
-        if np.isnan(px_next_open) or px_next_open <= 0:
-            equity_curve.append(equity if position == 0 else equity + position * row["close"])
-            continue
-
-        # --- 出場邏輯（已有多單時） --- #
-        if position > 0 and bool(row["long_exit"]):
-            gross = position * px_next_open           # 賣出總金額
-            fee = gross * fee_rate                    # 交易手續費
-            cash_in = gross - fee                     # 實收金額
-
-            # 粗略報酬率（含進出場雙邊手續費）
-            trade_ret = (px_next_open * (1 - fee_rate) / (entry_price * (1 + fee_rate))) - 1.0
-            pnl = cash_in  # 這裡沿用你原本的寫法，PnL 如需更精確可再調整
-
-            equity += cash_in
-            trades.append(
-                Trade(
-                    entry_time=entry_time,
-                    exit_time=row["open_time"],
-                    entry_price=entry_price,
-                    exit_price=px_next_open,
-                    pnl=pnl,
-                    ret=trade_ret,
-                )
-            )
-
-            position = 0.0
-            entry_price = None
-            entry_time = None
-
-        # --- 進場邏輯（目前空手 & 出現多頭訊號） --- #
-        if position == 0 and bool(row["long_entry"]):
-            # 全倉買進（扣手續費）
-            size = equity / (px_next_open * (1 + fee_rate))
-            cost = size * px_next_open
-            fee = cost * fee_rate
-
-            equity -= (cost + fee)
-            position = size
-            entry_price = px_next_open
-            entry_time = row["open_time"]
-
-        # --- 每個 bar 計算 MTM（市值） --- #
-        mtm_equity = equity + position * row["close"]
-        equity_curve.append(mtm_equity)
-
-    # 用 open_time 當 equity curve index（跟你的 SMA 版本風格一致）
-    equity_series = pd.Series(
-        equity_curve,
-        index=df_sig["open_time"].iloc[: len(equity_curve)]
+    # 還沒有 Alligator 值的前期資料（右移造成的 NaN 只出現在開頭），不做交易
+    lines_sum = (
+        df_sig["jaw"].to_numpy(dtype=np.float64) +
+        df_sig["teeth"].to_numpy(dtype=np.float64) +
+        df_sig["lips"].to_numpy(dtype=np.float64)
+    )
+    ready = ~np.isnan(lines_sum)
+    warmup = int(np.argmax(ready)) if ready.any() else len(df_sig)
+
+    return run_longonly(
+        open_=df_sig["open"].to_numpy(dtype=np.float64),
+        close=df_sig["close"].to_numpy(dtype=np.float64),
+        open_time=df_sig["open_time"],
+        entry=df_sig["long_entry"].to_numpy(dtype=bool),
+        exit_=df_sig["long_exit"].to_numpy(dtype=bool),
+        initial_equity=initial_equity,
+        fee_rate=fee_rate,
+        warmup=warmup,
     )
-
-    # 績效指標
-    returns = equity_series.pct_change().fillna(0.0)
-    total_return = equity_series.iloc[-1] / initial_equity - 1.0
-    max_equity = equity_series.cummax()
-    drawdown = equity_series / max_equity - 1.0
-    max_dd = drawdown.min()
-
-    if returns.std(ddof=0) > 0:
-        # 這裡假設 1 天 24 根 bar，252 交易日（你可依實際週期調整）
-        sharpe = (returns.mean() / returns.std(ddof=0)) * np.sqrt(252 * 24)
-    else:
-        sharpe = 0.0
-
-    stats = {
-        "initial_equity": initial_equity,
-        "final_equity": float(equity_series.iloc[-1]),
-        "total_return": float(total_return),
-        "max_drawdown": float(max_dd),
-        "sharpe_approx": float(sharpe),
-        "num_trades": len(trades),
-    }
-
-    return equity_series, trades, stats
 
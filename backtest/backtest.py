@@ -1,39 +1,47 @@
+import os
+import tempfile
+import numpy as np
 import pandas as pd
 import time
 from datetime import datetime, timedelta, timezone
-import ccxt
+from typing import TYPE_CHECKING
 import argparse
 import json
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 
 import backtest.alligator as alligator
 import backtest.sma as sma
 import backtest.ema as ema
 
+from backtest._engine import run_longonly_grid
 from backtest.signal_generator import generate_signal
 
-def fetch_klines_ccxt(
-    symbol: str = "XRP/USDT",
-    timeframe: str = "1h",
-    lookback_days: int = 365,
-) -> pd.DataFrame:
+# ccxt / matplotlib 載入很慢，只在真的要抓資料 / 畫圖時才 import
+if TYPE_CHECKING:
+    import ccxt
+
+CACHE_DIR = "cache"
+
+# --sweep 時 SMA / EMA 嘗試的參數組合
+SWEEP_FAST = [5, 7, 9, 10, 15, 20]
+SWEEP_SLOW = [30, 40, 50, 60, 100, 150, 200]
+
+
+def _cache_path(symbol: str, timeframe: str) -> str:
     """
-    從 Binance 用 ccxt 抓 OHLCV,回傳 DataFrame:
-    欄位 : open_time, open, high, low, close, volume
+    K 線快取檔路徑，例如 cache/XRPUSDT_1h.parquet
     """
-    exchange = ccxt.binance({
-        "enableRateLimit": True,  # 幫你自動 sleep，避免觸發 rate limit
-    })
+    return os.path.join(CACHE_DIR, f"{symbol.replace('/', '')}_{timeframe}.parquet")
 
-    # 往回抓 lookback_days 天
-    now_utc = datetime.now(timezone.utc)
-    since = int((now_utc - timedelta(days=lookback_days)).timestamp() * 1000)
 
+def _fetch_ohlcv_since(exchange: "ccxt.Exchange", symbol: str, timeframe: str, since: int) -> list[list]:
+    """
+    從 since (ms) 開始分頁抓 OHLCV，直到最新一根
+    """
     all_rows: list[list] = []
     limit = 1000
 
-    print(f"[INFO] Fetching {symbol} {timeframe} klines from Binance via ccxt (last {lookback_days} days)…")
-
     while True:
         ohlcv = exchange.fetch_ohlcv(symbol, timeframe=timeframe, since=since, limit=limit)
         if not ohlcv:
@@ -52,25 +60,98 @@ def fetch_klines_ccxt(
         # 避免打太快
         time.sleep(exchange.rateLimit / 1000)
 
-    if not all_rows:
-        raise RuntimeError("No kline data fetched, please check symbol/timeframe/lookback_days.")
+    return all_rows
 
-    df = pd.DataFrame(
-        all_rows,
-        columns=["open_time", "open", "high", "low", "close", "volume"],
-    )
 
-    # 型別處理
-    df["open_time"] = pd.to_datetime(df["open_time"], unit="ms", utc=True)
+@lru_cache(maxsize=1)
+def _public_exchange() -> "ccxt.Exchange":
+    """
+    抓公開 K 線用的 ccxt.binance，整個 process 共用一個（連線與 markets 只建立一次）
+    """
+    import ccxt
+
+    return ccxt.binance({
+        "enableRateLimit": True,  # 幫你自動 sleep，避免觸發 rate limit
+    })
+
+
+def fetch_klines_ccxt(
+    symbol: str = "XRP/USDT",
+    timeframe: str = "1h",
+    lookback_days: int = 365,
+    use_cache: bool = True,
+) -> pd.DataFrame:
+    """
+    從 Binance 用 ccxt 抓 OHLCV,回傳 DataFrame:
+    欄位 : open_time, open, high, low, close, volume
+
+    use_cache=True 時會把 K 線存到 cache/<SYMBOL>_<TIMEFRAME>.parquet，
+    下次只補抓快取最後一根之後的資料；最後一根還沒收完時直接讀快取。
+    """
+    exchange = _public_exchange()
+
+    # 往回抓 lookback_days 天
+    now_utc = datetime.now(timezone.utc)
+    since = int((now_utc - timedelta(days=lookback_days)).timestamp() * 1000)
+    since_time = pd.Timestamp(since, unit="ms", tz="UTC")
+    now_ms = int(now_utc.timestamp() * 1000)
+    bar_ms = exchange.parse_timeframe(timeframe) * 1000
+
+    fetch_since = since
+    cache_path = _cache_path(symbol, timeframe)
+    cached = None
+    if use_cache and os.path.exists(cache_path):
+        cached = pd.read_parquet(cache_path)
+        first_ts = int(cached["open_time"].iloc[0].timestamp() * 1000)
+        last_ts = int(cached["open_time"].iloc[-1].timestamp() * 1000)
+        if first_ts >= since + bar_ms:
+            # 快取不夠久，整段重抓
+            cached = None
+        elif last_ts + bar_ms > now_ms:
+            print(f"[INFO] Using cached {symbol} {timeframe} klines from {cache_path}")
+            return cached[cached["open_time"] >= since_time].reset_index(drop=True)
+        else:
+            # 最後一根可能是抓的時候還沒收完的 K 線，從它開始重抓
+            fetch_since = last_ts
+
+    print(f"[INFO] Fetching {symbol} {timeframe} klines from Binance via ccxt (last {lookback_days} days)…")
+
+    all_rows = _fetch_ohlcv_since(exchange, symbol, timeframe, fetch_since)
+
+    if not all_rows and cached is None:
+        raise RuntimeError("No kline data fetched, please check symbol/timeframe/lookback_days.")
+
+    # 一次把整批 K 線轉成 2D 陣列，再按欄位切出正確型別，不經過 DataFrame 的型別推斷 + astype
+    # 價格 / 成交量用 float32（約 7 位有效數字，回測報酬誤差 < 1e-5），省一半記憶體頻寬
     numeric_cols = ["open", "high", "low", "close", "volume"]
-    df[numeric_cols] = df[numeric_cols].astype(float)
+    arr = np.asarray(all_rows, dtype=np.float64).reshape(-1, 6)
+    df = pd.DataFrame({
+        "open_time": pd.to_datetime(arr[:, 0].astype(np.int64), unit="ms", utc=True),
+        **{col: arr[:, i + 1].astype(np.float32) for i, col in enumerate(numeric_cols)},
+    })
+
+    if cached is not None:
+        df = pd.concat([cached, df], ignore_index=True)
+        df = df.drop_duplicates(subset="open_time", keep="last")
+        df[numeric_cols] = df[numeric_cols].astype(np.float32)
 
     df = df.sort_values("open_time").reset_index(drop=True)
+
+    if use_cache:
+        # 先寫暫存檔再換名，避免中斷時留下壞掉的快取
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+
+    df = df[df["open_time"] >= since_time].reset_index(drop=True)
     print(f"[INFO] Fetched {len(df)} bars.")
     return df
 
 # === 畫資產曲線 ===
 def plot_equity_curve(eq: pd.Series, out_path: str | None = None):
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(10, 4))
     plt.plot(eq.index, eq.values)
     plt.title("Equity Curve (SMA20/50 Cross, ccxt+Binance)")
@@ -110,6 +191,91 @@ def backtest(strategy: str, df_sig: pd.DataFrame, initial_equity: float = 10_000
         raise ValueError(f"Unknown strategy: {strategy}")
 
 
+def backtest_grid(
+    strategy: str,
+    df: pd.DataFrame,
+    pairs: list[tuple[int, int]],
+    initial_equity: float = 10_000.0,
+    fee_rate: float = 0.001,
+) -> list[dict]:
+    """
+    一次回測 SMA / EMA 的多組 (fast, slow)，回傳與 pairs 同順序的 stats。
+    不建每組的 DataFrame，所有組合在同一個平行 kernel 裡跑完。
+    """
+
+    if strategy == "sma":
+        entries, exits = sma.grid_signals(df, pairs)
+    elif strategy == "ema":
+        entries, exits = ema.grid_signals(df, pairs)
+    else:
+        raise ValueError(f"Unsupported grid strategy: {strategy}")
+
+    return run_longonly_grid(
+        df["open"].to_numpy(dtype=np.float64),
+        df["close"].to_numpy(dtype=np.float64),
+        entries,
+        exits,
+        initial_equity=initial_equity,
+        fee_rate=fee_rate,
+    )
+
+
+# 每個 worker process 各自持有一份 K 線，只在啟動時載入一次
+_batch_df: pd.DataFrame | None = None
+
+
+def _init_batch_worker(klines_path: str):
+    global _batch_df
+    _batch_df = pd.read_parquet(klines_path)
+
+
+def _run_batch_task(task: tuple[dict, float, float]) -> dict:
+    config, initial_equity, fee_rate = task
+    df_sig = generate_signal(_batch_df, config["strategy"], **config.get("params", {}))
+    _, _, stats = backtest(config["strategy"], df_sig, initial_equity=initial_equity, fee_rate=fee_rate)
+    return stats
+
+
+def run_batch(
+    df_raw: pd.DataFrame,
+    configs: list[dict],
+    workers: int | None = None,
+    initial_equity: float = 10_000.0,
+    fee_rate: float = 0.001,
+) -> list[dict]:
+    """
+    用多個 process 平行跑多組回測，回傳與 configs 同順序的 stats。
+    configs 每一項例如: {"strategy": "sma", "params": {"fast": 10, "slow": 50}}
+    K 線先寫成一個 Parquet 檔，由每個 worker 啟動時讀入，不必每個任務都 pickle 一次。
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        klines_path = os.path.join(tmp_dir, "klines.parquet")
+        df_raw.to_parquet(klines_path, index=False)
+
+        tasks = [(config, initial_equity, fee_rate) for config in configs]
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_batch_worker,
+            initargs=(klines_path,),
+        ) as pool:
+            chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 4))
+            return list(pool.map(_run_batch_task, tasks, chunksize=chunksize))
+
+
+def sweep_configs(strategy: str) -> list[dict]:
+    """
+    --sweep 用的參數組合（alligator 沒有參數，只有一組）
+    """
+    if strategy == "alligator":
+        return [{"strategy": "alligator", "params": {}}]
+    return [
+        {"strategy": strategy, "params": {"fast": fast, "slow": slow}}
+        for fast in SWEEP_FAST
+        for slow in SWEEP_SLOW
+        if fast < slow
+    ]
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--symbol", type=str, default="XRP/USDT", help="交易對，例如 XRP/USDT, BTC/USDT")
@@ -120,10 +286,21 @@ def main():
     ap.add_argument("--no-plot", action="store_true", help="不要畫圖，只輸出數字")
     
     ap.add_argument("--strategy", type=str, default="sma", choices=["sma", "alligator", "ema"], help="選擇回測策略(預設 sma)")
+    ap.add_argument("--sweep", action="store_true", help="平行掃過 fast / slow 參數組合，輸出總報酬最高的一組")
+    ap.add_argument("--workers", type=int, default=None, help="--sweep 使用的 process 數（預設 CPU 核心數）")
     args = ap.parse_args()
 
     df_raw = fetch_klines_ccxt(symbol=args.symbol, timeframe=args.timeframe, lookback_days=args.days)
-    
+
+    if args.sweep:
+        configs = sweep_configs(args.strategy)
+        results = run_batch(df_raw, configs, workers=args.workers, initial_equity=args.initial, fee_rate=args.fee)
+        best_config, best_stats = max(zip(configs, results), key=lambda x: x[1]["total_return"])
+
+        print("[RESULT] Best parameters by total return:", best_config["params"])
+        print(json.dumps(best_stats, indent=2, ensure_ascii=False))
+        return
+
     df_sig = generate_signal(df_raw, args.strategy, fast=10, slow=50)
     equity, trades, stats = backtest(
         strategy=args.strategy,
@@ -2,57 +2,81 @@ from typing import List
 
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
+from backtest._engine import run_longonly
+from backtest._kernels import cross_signals, ewma
 from backtest.types_trading import Trade
 
-def add_ema_indicators(df: pd.DataFrame, fast: int = 20, slow: int = 50) -> pd.DataFrame:
+def ema_columns(
+    df: pd.DataFrame,
+    fast: int = 20,
+    slow: int = 50,
+    ma_cache: dict[int, np.ndarray] | None = None,
+) -> dict[str, np.ndarray]:
     """
-    在 DataFrame 上加上 EMA_fast / EMA_slow
+    計算 EMA_fast / EMA_slow，回傳 {欄位名稱: 陣列}，不修改 df。
+    ma_cache: {週期: EMA 陣列}，同一份 df 掃多組參數時傳同一個 dict，每個週期只算一次。
     """
     if fast >= slow:
         raise ValueError("EMA fast 必須小於 slow，例如 fast=20, slow=50")
 
-    out = df.copy()
-    close = out["close"]
+    if ma_cache is None:
+        ma_cache = {}
 
-    out[f"EMA_{fast}"] = close.ewm(span=fast, adjust=False).mean()
-    out[f"EMA_{slow}"] = close.ewm(span=slow, adjust=False).mean()
+    close = None
+    for n in (fast, slow):
+        if n not in ma_cache:
+            if close is None:
+                close = df["close"].to_numpy(dtype=np.float64)
+            ma_cache[n] = ewma(close, 2.0 / (n + 1))
 
-    return out
+    return {
+        f"EMA_{fast}": ma_cache[fast],
+        f"EMA_{slow}": ma_cache[slow],
+    }
 
 
-def compute_signals(df: pd.DataFrame, fast: int = 20, slow: int = 50) -> pd.DataFrame:
+def compute_signals(
+    df: pd.DataFrame,
+    fast: int = 20,
+    slow: int = 50,
+    ma_cache: dict[int, np.ndarray] | None = None,
+) -> pd.DataFrame:
     """
     產生可調參數的 EMA fast / EMA slow 交叉策略訊號。
     - 黃金交叉 → signal_long = True
     - 死亡交叉 → signal_exit = True
+    新欄位最後用一次 assign 接上，整個流程只複製 df 一次。
+    ma_cache 見 ema_columns。
     """
 
-    out = add_ema_indicators(df, fast=fast, slow=slow)
+    cols = ema_columns(df, fast=fast, slow=slow, ma_cache=ma_cache)
 
-    ema_fast = f"EMA_{fast}"
-    ema_slow = f"EMA_{slow}"
+    # 黃金交叉 → signal_long，死亡交叉 → signal_exit
+    cols["signal_long"], cols["signal_exit"] = cross_signals(cols[f"EMA_{fast}"], cols[f"EMA_{slow}"])
 
-    out[f"{ema_fast}_prev"] = out[ema_fast].shift(1)
-    out[f"{ema_slow}_prev"] = out[ema_slow].shift(1)
+    return df.assign(**cols)
 
-    # 黃金交叉
-    out["signal_long"] = (
-        (out[f"{ema_fast}_prev"] <= out[f"{ema_slow}_prev"]) &
-        (out[ema_fast] > out[ema_slow])
-    )
 
-    # 死亡交叉
-    out["signal_exit"] = (
-        (out[f"{ema_fast}_prev"] >= out[f"{ema_slow}_prev"]) &
-        (out[ema_fast] < out[ema_slow])
-    )
+def grid_signals(
+    df: pd.DataFrame,
+    pairs: list[tuple[int, int]],
+    ma_cache: dict[int, np.ndarray] | None = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    多組 (fast, slow) 的交叉訊號矩陣 (signal_long, signal_exit)，shape = (K 線數, len(pairs))。
+    每個週期的均線只算一次；欄位用 Fortran order 存，回測 kernel 逐欄讀取時是連續記憶體。
+    """
+    if ma_cache is None:
+        ma_cache = {}
 
-    # 下一根 K 的 open 當作下單價
-    out["next_open"] = out["open"].shift(-1)
+    signal_long = np.empty((len(df), len(pairs)), dtype=bool, order="F")
+    signal_exit = np.empty((len(df), len(pairs)), dtype=bool, order="F")
+    for k, (fast, slow) in enumerate(pairs):
+        cols = ema_columns(df, fast=fast, slow=slow, ma_cache=ma_cache)
+        signal_long[:, k], signal_exit[:, k] = cross_signals(cols[f"EMA_{fast}"], cols[f"EMA_{slow}"])
 
-    return out
+    return signal_long, signal_exit
 
 
 def backtest_ema_cross(
@@ -60,85 +84,16 @@ def backtest_ema_cross(
     initial_equity: float = 10_000.0,
     fee_rate: float = 0.001,
 ) -> tuple[pd.Series, List[Trade], dict]:
-
-    equity_curve = []
-    trades: List[Trade] = []
-
-    cash = initial_equity
-    position = 0.0
-    entry_price = None
-    entry_time = None
-
-    for i in range(len(df_sig) - 1):
-        row = df_sig.iloc[i]
-        px_next_open = row["next_open"]
-
-        if np.isnan(px_next_open) or px_next_open <= 0:
-            equity_curve.append(cash + position * row["close"])
-            continue
-
-        if position > 0 and row["signal_exit"]:
-            gross = position * px_next_open
-            fee = gross * fee_rate
-            cash_in = gross - fee
-
-            ret = (px_next_open * (1 - fee_rate)) / (entry_price * (1 + fee_rate)) - 1.0
-            pnl = cash_in
-
-            cash += cash_in
-
-            trades.append(
-                Trade(
-                    entry_time=entry_time,
-                    exit_time=row["open_time"],
-                    entry_price=entry_price,
-                    exit_price=px_next_open,
-                    pnl=pnl,
-                    ret=ret,
-                )
-            )
-
-            # reset
-            position = 0.0
-            entry_price = None
-            entry_time = None
-
-        if position == 0 and row["signal_long"]:
-            size = cash / (px_next_open * (1 + fee_rate))
-            cost = size * px_next_open
-            fee = cost * fee_rate
-
-            cash -= (cost + fee)
-
-            position = size
-            entry_price = px_next_open
-            entry_time = row["open_time"]
-
-        mtm_equity = cash + position * row["close"]
-        equity_curve.append(mtm_equity)
-
-    equity_series = pd.Series(
-        equity_curve, 
-        index=df_sig["open_time"].iloc[: len(equity_curve)]
+    """
+    全倉交叉策略回測（只做多）：signal_long 進場、signal_exit 出場，
+    細節見 backtest._engine.run_longonly。
+    """
+    return run_longonly(
+        open_=df_sig["open"].to_numpy(dtype=np.float64),
+        close=df_sig["close"].to_numpy(dtype=np.float64),
+        open_time=df_sig["open_time"],
+        entry=df_sig["signal_long"].to_numpy(dtype=bool),
+        exit_=df_sig["signal_exit"].to_numpy(dtype=bool),
+        initial_equity=initial_equity,
+        fee_rate=fee_rate,
     )
-
-    returns = equity_series.pct_change().fillna(0.0)
-    total_return = equity_series.iloc[-1] / initial_equity - 1.0
-    max_equity = equity_series.cummax()
-    drawdown = equity_series / max_equity - 1.0
-    max_dd = drawdown.min()
-
-    sharpe = 0.0
-    if returns.std(ddof=0) > 0:
-        sharpe = (returns.mean() / returns.std(ddof=0)) * np.sqrt(252 * 24)
-
-    stats = {
-        "initial_equity": initial_equity,
-        "final_equity": float(equity_series.iloc[-1]),
-        "total_return": float(total_return),
-        "max_drawdown": float(max_dd),
-        "sharpe_approx": float(sharpe),
-        "num_trades": len(trades),
-    }
-
-    return equity_series, trades, stats
@@ -3,15 +3,28 @@ import backtest.sma as sma
 import backtest.ema as ema
 import backtest.alligator as alligator
 
+def _sma_signals(df, params):
+    return sma.compute_signals(df, fast=params["fast"], slow=params["slow"], ma_cache=params.get("ma_cache"))
+
+def _ema_signals(df, params):
+    return ema.compute_signals(df, fast=params["fast"], slow=params["slow"], ma_cache=params.get("ma_cache"))
+
+def _alligator_signals(df, params):
+    return alligator.compute_signals(df)
+
+# 策略名稱 → 產生訊號的函式
+SIGNAL_FUNCS = {
+    "sma": _sma_signals,
+    "ema": _ema_signals,
+    "alligator": _alligator_signals,
+}
+
 def generate_signal(df, strategy, trader=False, **params):
-    df_sig = None
-    
-    if strategy == "sma":
-        df_sig = sma.compute_signals(df, fast=params["fast"], slow=params["slow"])
-    elif strategy == "ema":
-        df_sig = ema.compute_signals(df, fast=params["fast"], slow=params["slow"])
-    elif strategy == "alligator":
-        df_sig = alligator.compute_signals(df)
+    signal_fn = SIGNAL_FUNCS.get(strategy)
+    if signal_fn is None:
+        raise ValueError(f"Unknown strategy: {strategy}")
+
+    df_sig = signal_fn(df, params)
     
     if trader:  
         # 用倒數第二根避免 repaint
@@ -9,67 +9,164 @@
 """
 
 import argparse
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 
+import numpy as np
 import requests
 import pandas as pd
 
+# orjson 是選用套件：有裝就用它的 C parser 解析 K 線 JSON，沒有就退回標準函式庫
+try:
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+from trader.utils import ema
+
 BASE_URL = "https://api.binance.com/api/v3/klines"
+CACHE_DIR = os.path.join("cache", "binance_api")
+
+# 同時抓幾頁（每頁 weight 2，Binance 限制每分鐘 6000 weight，4 個 thread 很安全）
+FETCH_WORKERS = 4
+
+# 固定長度的 K 線週期 (ms)，用來預先切好每一頁的時間範圍
+INTERVAL_MS = {
+    "1s": 1_000,
+    "1m": 60_000,
+    "3m": 180_000,
+    "5m": 300_000,
+    "15m": 900_000,
+    "30m": 1_800_000,
+    "1h": 3_600_000,
+    "2h": 7_200_000,
+    "4h": 14_400_000,
+    "6h": 21_600_000,
+    "8h": 28_800_000,
+    "12h": 43_200_000,
+    "1d": 86_400_000,
+    "3d": 259_200_000,
+    "1w": 604_800_000,
+}
+
+# Binance K 線每一列的欄位，以及要轉成數值的欄位型別（其餘欄位維持原始值）
+# 價格 / 成交量用 float32（約 7 位有效數字），與 backtest.fetch_klines_ccxt 相同，省一半記憶體頻寬
+KLINE_COLUMNS = [
+    "open_time",
+    "open",
+    "high",
+    "low",
+    "close",
+    "volume",
+    "close_time",
+    "quote_asset_volume",
+    "number_of_trades",
+    "taker_buy_base_volume",
+    "taker_buy_quote_volume",
+    "ignore",
+]
+KLINE_DTYPES = {
+    "open_time": np.int64,
+    "open": np.float32,
+    "high": np.float32,
+    "low": np.float32,
+    "close": np.float32,
+    "volume": np.float32,
+    "close_time": np.int64,
+    "number_of_trades": np.int64,
+}
+
+# 整個模組共用一個連線，不用每一頁都重新做 TCP / TLS 握手
+_SESSION = requests.Session()
+
+
+def _cache_path(symbol: str, interval: str) -> str:
+    """
+    K 線快取檔路徑，例如 cache/binance_api/XRPUSDT_1h.parquet
+    （和 backtest.fetch_klines_ccxt 的快取分開放，欄位不一樣）
+    """
+    return os.path.join(CACHE_DIR, f"{symbol}_{interval}.parquet")
 
 
-def fetch_klines(
-    symbol: str = "XRPUSDT",
-    interval: str = "1h",
-    lookback_days: int = 365,
-) -> pd.DataFrame:
+def _get_page(symbol: str, interval: str, start_ts: int, end_ts: int, limit: int) -> list[list]:
     """
-    從 Binance 抓指定商品的歷史 K 線資料（現貨），回傳 pandas DataFrame。
+    抓一頁 K 線；被限流 (HTTP 429) 時照 Retry-After（預設 0.2 秒）等一下再重試
+    """
+    params = {
+        "symbol": symbol,
+        "interval": interval,
+        "startTime": start_ts,
+        "endTime": end_ts,
+        "limit": limit,
+    }
+    while True:
+        resp = _SESSION.get(BASE_URL, params=params, timeout=10)
+        if resp.status_code != 429:
+            break
+        time.sleep(float(resp.headers.get("Retry-After", 0.2)))
+    resp.raise_for_status()
+    return _json_loads(resp.content)
 
-    :param symbol: 幣安交易對，例如 "XRPUSDT", "BTCUSDT"
-    :param interval: K 線週期，例如 "1m", "5m", "15m", "1h", "4h", "1d"
-    :param lookback_days: 往回抓幾天的資料（例如 30, 365）
+
+def _stack_pages(pages, max_rows: int) -> np.ndarray:
+    """
+    把一頁頁的 K 線依序填進預先配置好的 (max_rows, 12) object 陣列，回傳實際有資料的部分
     """
+    out = np.empty((max_rows, len(KLINE_COLUMNS)), dtype=object)
+    cursor = 0
+    for data in pages:
+        if data:
+            out[cursor:cursor + len(data)] = data
+            cursor += len(data)
+    return out[:cursor]
 
-    end_ts = int(time.time() * 1000)  # 目前時間 (ms)
-    now_utc = datetime.now(timezone.utc)
-    start_ts = int((now_utc - timedelta(days=lookback_days)).timestamp() * 1000)
 
-    all_rows = []
-    limit = 1000  # Binance 單次最多 1000 根
+def _fetch_rows(symbol: str, interval: str, start_ts: int, end_ts: int) -> np.ndarray:
+    """
+    從 start_ts (ms) 分頁抓到 end_ts (ms)，回傳 Binance 原始 K 線，shape = (根數, 12) 的 object 陣列
 
-    print(f"[INFO] Fetching {symbol} {interval} klines for last {lookback_days} days...")
+    週期長度固定時，每頁的時間範圍可以先算好，用幾個 thread 同時抓
+    （共用同一個 Session，重複使用 TCP/TLS 連線）；
+    週期長度不固定（例如 1M）時，照順序一頁接一頁抓。
+    """
+    limit = 1000  # Binance 單次最多 1000 根
 
+    # data[i] 結構參考：
+    # 0  open time
+    # 1  open
+    # 2  high
+    # 3  low
+    # 4  close
+    # 5  volume
+    # 6  close time
+    # 7  quote asset volume
+    # 8  number of trades
+    # 9  taker buy base asset volume
+    # 10 taker buy quote asset volume
+    # 11 ignore
+
+    interval_ms = INTERVAL_MS.get(interval)
+    if interval_ms is not None:
+        page_ms = interval_ms * limit
+        starts = range(start_ts, end_ts + 1, page_ms)
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+            pages = pool.map(
+                lambda s: _get_page(symbol, interval, s, min(s + page_ms - 1, end_ts), limit),
+                starts,
+            )
+            # 頁數已知，最多 len(starts) * limit 根，一次配置好再逐頁填入
+            return _stack_pages(pages, len(starts) * limit)
+
+    pages = []
     while True:
-        params = {
-            "symbol": symbol,
-            "interval": interval,
-            "startTime": start_ts,
-            "endTime": end_ts,
-            "limit": limit,
-        }
-        resp = requests.get(BASE_URL, params=params, timeout=10)
-        resp.raise_for_status()
-        data = resp.json()
+        data = _get_page(symbol, interval, start_ts, end_ts, limit)
 
         if not data:
             break
 
-        all_rows.extend(data)
-
-        # data[i] 結構參考：
-        # 0  open time
-        # 1  open
-        # 2  high
-        # 3  low
-        # 4  close
-        # 5  volume
-        # 6  close time
-        # 7  quote asset volume
-        # 8  number of trades
-        # 9  taker buy base asset volume
-        # 10 taker buy quote asset volume
-        # 11 ignore
+        pages.append(data)
 
         last_close_time = data[-1][6]
         # 如果下一個 startTime 已經超過 end_ts，就結束
@@ -79,41 +176,83 @@ def fetch_klines(
         # 下一輪從上一根 K 線結束時間再往後 +1 ms
         start_ts = last_close_time + 1
 
-        # 小小 sleep，避免打太快
-        time.sleep(0.2)
+    return _stack_pages(pages, sum(len(data) for data in pages))
 
-    if not all_rows:
-        raise RuntimeError("No kline data fetched. Check symbol/interval/lookback_days.")
 
-    # 轉成 DataFrame
-    df = pd.DataFrame(
-        all_rows,
-        columns=[
-            "open_time",
-            "open",
-            "high",
-            "low",
-            "close",
-            "volume",
-            "close_time",
-            "quote_asset_volume",
-            "number_of_trades",
-            "taker_buy_base_volume",
-            "taker_buy_quote_volume",
-            "ignore",
-        ],
-    )
+def fetch_klines(
+    symbol: str = "XRPUSDT",
+    interval: str = "1h",
+    lookback_days: int = 365,
+    use_cache: bool = True,
+) -> pd.DataFrame:
+    """
+    從 Binance 抓指定商品的歷史 K 線資料（現貨），回傳 pandas DataFrame。
 
-    # 型別處理
-    numeric_cols = ["open", "high", "low", "close", "volume"]
-    df[numeric_cols] = df[numeric_cols].astype(float)
+    :param symbol: 幣安交易對，例如 "XRPUSDT", "BTCUSDT"
+    :param interval: K 線週期，例如 "1m", "5m", "15m", "1h", "4h", "1d"
+    :param lookback_days: 往回抓幾天的資料（例如 30, 365）
+    :param use_cache: 把 K 線存到 cache/binance_api/<SYMBOL>_<INTERVAL>.parquet，
+                      下次只補抓快取最後一根之後的資料
+    """
+
+    end_ts = int(time.time() * 1000)  # 目前時間 (ms)
+    now_utc = datetime.now(timezone.utc)
+    start_ts = int((now_utc - timedelta(days=lookback_days)).timestamp() * 1000)
+    start_time = pd.Timestamp(start_ts, unit="ms", tz="UTC")
+
+    fetch_start = start_ts
+    cache_path = _cache_path(symbol, interval)
+    cached = None
+    if use_cache and os.path.exists(cache_path):
+        cached = pd.read_parquet(cache_path)
+        first_open = cached["open_time"].iloc[0]
+        last_close = cached["close_time"].iloc[-1]
+        bar = cached["close_time"].iloc[0] - first_open
+        if first_open > start_time + bar:
+            # 快取不夠久，整段重抓
+            cached = None
+        elif int(last_close.timestamp() * 1000) >= end_ts:
+            # 最後一根還沒收完，快取已經是最新的
+            print(f"[INFO] Using cached {symbol} {interval} klines from {cache_path}")
+            return cached[cached["open_time"] >= start_time].reset_index(drop=True)
+        else:
+            # 最後一根可能是抓的時候還沒收完的 K 線，從它開始重抓
+            fetch_start = int(cached["open_time"].iloc[-1].timestamp() * 1000)
+
+    print(f"[INFO] Fetching {symbol} {interval} klines for last {lookback_days} days...")
+
+    arr = _fetch_rows(symbol, interval, fetch_start, end_ts)
+
+    if len(arr) == 0 and cached is None:
+        raise RuntimeError("No kline data fetched. Check symbol/interval/lookback_days.")
+
+    # 已經是 2D object 陣列，直接按欄位轉型，不經過 DataFrame 的逐格型別推斷 + astype
+    df = pd.DataFrame({
+        col: arr[:, i].astype(KLINE_DTYPES[col]) if col in KLINE_DTYPES else arr[:, i]
+        for i, col in enumerate(KLINE_COLUMNS)
+    })
     df["open_time"] = pd.to_datetime(df["open_time"], unit="ms", utc=True)
     df["close_time"] = pd.to_datetime(df["close_time"], unit="ms", utc=True)
 
-    # 依時間排序（保險起見）
-    df = df.sort_values("open_time").reset_index(drop=True)
+    if cached is not None:
+        df = pd.concat([cached, df], ignore_index=True)
+        df = df.drop_duplicates(subset="open_time", keep="last")
+        # 舊版快取可能是 float64，合併後統一轉回
+        df = df.astype({col: dtype for col, dtype in KLINE_DTYPES.items() if dtype == np.float32})
+
+    # 分頁照時間順序抓、快取接在前面，通常已經排好；只有亂序時才排序
+    if not df["open_time"].is_monotonic_increasing:
+        df = df.sort_values("open_time")
+    df = df.reset_index(drop=True)
+
+    if use_cache:
+        # 先寫暫存檔再換名，避免中斷時留下壞掉的快取
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        df.to_parquet(tmp_path, index=False, compression="zstd")
+        os.replace(tmp_path, cache_path)
 
-    return df
+    return df[df["open_time"] >= start_time].reset_index(drop=True)
 
 
 def add_indicators(df: pd.DataFrame) -> pd.DataFrame:
@@ -122,15 +261,15 @@ def add_indicators(df: pd.DataFrame) -> pd.DataFrame:
     - SMA_20, SMA_50
     - EMA_20, EMA_50
     """
-    out = df.copy()
-    close = out["close"]
-
-    out["SMA_20"] = close.rolling(window=20, min_periods=20).mean()
-    out["SMA_50"] = close.rolling(window=50, min_periods=50).mean()
-    out["EMA_20"] = close.ewm(span=20, adjust=False).mean()
-    out["EMA_50"] = close.ewm(span=50, adjust=False).mean()
-
-    return out
+    close = df["close"]
+
+    # 新欄位最後用一次 assign 接上，不先 copy 整個 df 再逐欄插入
+    return df.assign(
+        SMA_20=close.rolling(window=20, min_periods=20).mean(),
+        SMA_50=close.rolling(window=50, min_periods=50).mean(),
+        EMA_20=ema(close, 20),
+        EMA_50=ema(close, 50),
+    )
 
 
 def main():
@@ -154,9 +293,11 @@ def main():
         default=None,
         help="輸出 CSV 檔名（預設自動用 symbol_interval_days.csv）",
     )
+    parser.add_argument("--no-cache", action="store_true", help="不讀寫本地 K 線快取，整段重抓")
     args = parser.parse_args()
 
-    df = fetch_klines(symbol=args.symbol, interval=args.interval, lookback_days=args.lookback_days)
+    df = fetch_klines(symbol=args.symbol, interval=args.interval, lookback_days=args.lookback_days,
+                      use_cache=not args.no_cache)
     df = add_indicators(df)
 
     if args.output:
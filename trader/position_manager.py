@@ -4,14 +4,20 @@ Position Manager Module
 Avoid repeat order
 """
 
+import math
+
 class PositionManager:
+    # 每個 tick 都會讀這些屬性，用 __slots__ 省掉 instance __dict__ 的查找
+    __slots__ = ("active", "qty", "entry_price", "entry_time", "stop_loss", "take_profit")
+
     def __init__(self):
         self.active = False
         self.qty = 0.0
         self.entry_price = 0.0
         self.entry_time = None
-        self.stop_loss = None
-        self.take_profit = None
+        # 沒設停損 / 停利時用 -inf / +inf，should_exit 不必再判斷 None
+        self.stop_loss = -math.inf
+        self.take_profit = math.inf
 
     def open_long(self, price, qty, timestamp, sl=None, tp=None):
         """建立多頭部位"""
@@ -19,25 +25,12 @@ class PositionManager:
         self.qty = qty
         self.entry_price = price
         self.entry_time = timestamp
-        self.stop_loss = sl
-        self.take_profit = tp
+        self.stop_loss = sl if sl is not None else -math.inf
+        self.take_profit = tp if tp is not None else math.inf
 
     def should_exit(self, price, exit_signal=False):
-        """判斷是否需要平倉"""
-
-        # 1. 策略 Exit 訊號
-        if exit_signal:
-            return True
-
-        # 2. 觸發停損
-        if self.stop_loss is not None and price <= self.stop_loss:
-            return True
-
-        # 3. 觸發停利
-        if self.take_profit is not None and price >= self.take_profit:
-            return True
-
-        return False
+        """判斷是否需要平倉：策略 Exit 訊號、觸發停損、觸發停利"""
+        return bool(exit_signal) or price <= self.stop_loss or price >= self.take_profit
 
     def close_position(self):
         """平倉後清空部位"""
@@ -45,5 +38,5 @@ class PositionManager:
         self.qty = 0.0
         self.entry_price = 0.0
         self.entry_time = None
-        self.stop_loss = None
-        self.take_profit = None
+        self.stop_loss = -math.inf
+        self.take_profit = math.inf
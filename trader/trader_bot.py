@@ -1,8 +1,10 @@
 import json
-import time
+import asyncio
+from collections import deque
 import ccxt
 import yaml
 import argparse
+from functools import lru_cache
 import pandas as pd
 
 # import trader.order
@@ -11,34 +13,74 @@ from backtest.signal_generator import generate_signal
 
 import backtest.backtest as BT
 
-def fetch_ohlcv(exchange, symbol, timeframe="5m", limit=200) -> pd.DataFrame:
-    bars = exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
-    df = pd.DataFrame(bars, columns=["ts","open","high","low","close","volume"])
+def _ohlcv_to_df(bars) -> pd.DataFrame:
+    df = pd.DataFrame(list(bars), columns=["ts","open","high","low","close","volume"])
     df["ts"] = pd.to_datetime(df["ts"], unit="ms")
     return df
 
+def fetch_ohlcv(exchange, symbol, timeframe="5m", limit=200) -> pd.DataFrame:
+    bars = exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit)
+    return _ohlcv_to_df(bars)
+
+async def stream_closed_bars(symbol, timeframe="5m", limit=200):
+    """
+    用 websocket（ccxt.pro watch_ohlcv）訂閱 K 線，每收完一根才 yield 一次
+    最近 limit 根「已收盤」K 線的 DataFrame（欄位同 fetch_ohlcv），
+    不必每隔幾秒用 REST 重抓整段。
+    """
+    import ccxt.pro as ccxtpro
+
+    exchange = ccxtpro.binance({"enableRateLimit": True})
+    try:
+        # 先用 REST 抓一次歷史；最後一根還沒收完，另外記著
+        bars = await exchange.fetch_ohlcv(symbol, timeframe=timeframe, limit=limit + 1)
+        closed = deque(bars[:-1], maxlen=limit)
+        forming = bars[-1] if bars else None
+
+        while True:
+            updates = await exchange.watch_ohlcv(symbol, timeframe)
+            new_bar_closed = False
+            for bar in updates:
+                # 出現更新的 K 線 → 上一根收盤了
+                if forming is not None and bar[0] > forming[0]:
+                    closed.append(forming)
+                    new_bar_closed = True
+                if forming is None or bar[0] >= forming[0]:
+                    forming = bar
+
+            if new_bar_closed:
+                yield _ohlcv_to_df(closed)
+    finally:
+        await exchange.close()
+
+@lru_cache(maxsize=1)
 def load_config(path="../config.yaml") -> dict:
     """
     Load configure file
+    (cached per path; callers share the returned dict, so don't modify it)
     """
     with open(path, "r") as f:
         config = yaml.safe_load(f)
     return config
 
+@lru_cache(maxsize=4)
+def _binance_exchange(api_key: str, secret: str) -> ccxt.Exchange:
+    return ccxt.binance({
+        "apiKey": api_key,
+        "secret": secret,
+        "enableRateLimit": True,
+    })
+
 def get_exchange(config: dict) -> ccxt.Exchange:
     """
     Create and return a ccxt exchange object based on the configuration file
+    (the same credentials reuse the same exchange object and its loaded markets)
     """
     exchange_id = config.get("EXCHANGE")
     api_key = config.get("API_KEY", "")
     secret = config.get("SECRET", "")
     if exchange_id == "binance":
-        exchange = ccxt.binance({
-            "apiKey": api_key,
-            "secret": secret,
-            "enableRateLimit": True,
-        })
-        return exchange
+        return _binance_exchange(api_key, secret)
 
     return None
 
@@ -47,13 +89,8 @@ def apply_strategy(df, name, **params):
     根據策略名稱產生訊號
     params 用來塞策略參數（例如 sma_fast, sma_slow, ema_fast, ema_slow）
     """
-    df_sig = None
-    try :
-        df_sig = generate_signal(df, name, trader=False, **params)
-    except:
-        raise ValueError(f"Unknown strategy: {name}")
-
-    return df_sig
+    # 未知的策略名稱由 generate_signal 丟出 ValueError，其他錯誤照原樣往上傳
+    return generate_signal(df, name, trader=False, **params)
 
 def best_strategy(symbol, timeframe, lookback_days=365):
     """
@@ -69,37 +106,26 @@ def best_strategy(symbol, timeframe, lookback_days=365):
 
     sma_fast_list = [5, 7, 9, 10, 15, 20]
     sma_slow_list = [30, 40, 50, 60, 100, 150, 200]
+    sma_pairs = [(fast, slow) for fast in sma_fast_list for slow in sma_slow_list if fast < slow]
 
-    for fast in sma_fast_list:
-        for slow in sma_slow_list:
-            if fast >= slow:
-                continue
-            
-            df_sig = apply_strategy(df, "sma", fast=fast, slow=slow)
-            _, _, stats = BT.backtest("sma", df_sig)
-
-            all_results.append((
-                "sma",
-                {"fast": fast, "slow": slow},
-                stats
-            ))
+    # 所有 (fast, slow) 組合一次丟進平行的回測 kernel，每個週期的均線只算一次
+    for (fast, slow), stats in zip(sma_pairs, BT.backtest_grid("sma", df, sma_pairs)):
+        all_results.append((
+            "sma",
+            {"fast": fast, "slow": slow},
+            stats
+        ))
 
     ema_fast_list = [5, 7, 9, 10, 15, 20]
     ema_slow_list = [30, 40, 50, 60, 100, 150, 200]
+    ema_pairs = [(fast, slow) for fast in ema_fast_list for slow in ema_slow_list if fast < slow]
 
-    for fast in ema_fast_list:
-        for slow in ema_slow_list:
-            if fast >= slow:
-                continue
-            
-            df_sig = apply_strategy(df, "ema", fast=fast, slow=slow)
-            _, _, stats = BT.backtest("ema", df_sig)
-
-            all_results.append((
-                "ema",
-                {"fast": fast, "slow": slow},
-                stats
-            ))
+    for (fast, slow), stats in zip(ema_pairs, BT.backtest_grid("ema", df, ema_pairs)):
+        all_results.append((
+            "ema",
+            {"fast": fast, "slow": slow},
+            stats
+        ))
 
     df_sig = apply_strategy(df, "alligator")
     _, _, stats = BT.backtest("alligator", df_sig)
@@ -143,13 +169,19 @@ def main():
     exchange = get_exchange(config)
     pm = PositionManager()
 
-    while True:
-        # df = fetch_ohlcv(exchange, symbol, timeFrame)
-        if strategy == "auto":
-            best_strat, best_params = best_strategy(symbol, timeFrame, lookback_days=365)
-            strategy = best_strat
+    if strategy == "auto":
+        best_strat, best_params = best_strategy(symbol, timeFrame, lookback_days=365)
+        strategy = best_strat
+
+    asyncio.run(trade_loop(exchange, pm, symbol, timeFrame, strategy, equity))
+
+async def trade_loop(exchange, pm, symbol, timeFrame, strategy, equity):
+    """
+    每收完一根 K 線跑一次訊號 / 下單邏輯
+    """
+    async for df in stream_closed_bars(symbol, timeFrame):
         # df_sig = generate_signal(df, strategy)
-        # last = df_sig.iloc[-2]
+        # last = df_sig.iloc[-1]  # stream 只給已收盤的 K 線，最後一根就是剛收完的
 
         # price = last["close"]
 
@@ -168,9 +200,7 @@ def main():
         #     exchange.create_order(symbol, "market", "sell", pm.qty)
         #     print("SELL", pm.qty, price)
         #     pm.close_position()
-
-        time.sleep(5)
+        pass
 
 if __name__ == "__main__":
     main()
-        
\ No newline at end of file
@@ -1,18 +1,80 @@
 import pandas as pd
 import numpy as np
 
+from backtest._kernels import ewma
+from backtest._njit import njit
+
+@njit(cache=True)
+def _sma_nb(x: np.ndarray, n: int) -> np.ndarray:
+    # 滾動和：加入新值、扣掉滑出視窗的舊值，O(n) 一次掃完；前 n-1 根為 NaN
+    m = x.shape[0]
+    out = np.full(m, np.nan)
+    s = 0.0
+    for i in range(m):
+        s += x[i]
+        if i >= n:
+            s -= x[i - n]
+        if i >= n - 1:
+            out[i] = s / n
+    return out
+
 def sma(series: pd.Series, n: int) -> pd.Series:
-    return series.rolling(n, min_periods=n).mean()
+    return pd.Series(_sma_nb(series.to_numpy(dtype=np.float64), n), index=series.index)
+
+def ema(series: pd.Series, span: int) -> pd.Series:
+    # 等同 series.ewm(span=span, adjust=False).mean()，用 Numba 遞迴 kernel 計算
+    return pd.Series(ewma(series.to_numpy(dtype=np.float64), 2.0 / (span + 1)), index=series.index)
+
+def ema_last(series: pd.Series, span: int, window: int) -> float:
+    # 只要最後一個 EMA 值時（例如每根新 K 線刷新訊號），用最後 window 根做一次加權內積：
+    # 以 x[-window] 為起點的 ewm(adjust=False)，window 夠長時與全序列 EMA 幾乎相同
+    alpha = 2.0 / (span + 1)
+    x = series.to_numpy(dtype=np.float64)[-window:]
+    w = alpha * (1.0 - alpha) ** np.arange(len(x) - 1, -1, -1)
+    w[0] /= alpha
+    return float(w @ x)
 
 def true_range(df: pd.DataFrame) -> pd.Series:
-    prev_close = df['close'].shift(1)
-    tr1 = df['high'] - df['low']
-    tr2 = (df['high'] - prev_close).abs()
-    tr3 = (df['low'] - prev_close).abs()
-    return pd.concat([tr1, tr2, tr3], axis=1).max(axis=1)
+    high = df['high'].to_numpy(dtype=np.float64)
+    low = df['low'].to_numpy(dtype=np.float64)
+    prev_close = np.empty_like(high)
+    prev_close[:1] = np.nan
+    prev_close[1:] = df['close'].to_numpy(dtype=np.float64)[:-1]
+    # fmax 跳過 NaN，第一根沒有前收盤時 TR = high - low（與逐列 max 相同）
+    tr = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return pd.Series(tr, index=df.index)
+
+@njit(cache=True)
+def _atr_nb(high: np.ndarray, low: np.ndarray, close: np.ndarray, n: int) -> np.ndarray:
+    # TR 與 n 期滾動平均在同一個迴圈算完，不建中間的 TR 陣列；
+    # 滑出視窗的舊 TR 存在長度 n 的環狀緩衝區。結果同 _sma_nb(true_range)
+    m = high.shape[0]
+    out = np.full(m, np.nan)
+    buf = np.empty(n)
+    s = 0.0
+    for i in range(m):
+        tr = high[i] - low[i]
+        if i > 0:
+            pc = close[i - 1]
+            tr = max(tr, abs(high[i] - pc), abs(low[i] - pc))
+        s += tr
+        if i >= n:
+            s -= buf[i % n]
+        buf[i % n] = tr
+        if i >= n - 1:
+            out[i] = s / n
+    return out
 
 def atr(df: pd.DataFrame, n: int) -> pd.Series:
-    return true_range(df).rolling(n, min_periods=n).mean()
+    return pd.Series(
+        _atr_nb(
+            df['high'].to_numpy(dtype=np.float64),
+            df['low'].to_numpy(dtype=np.float64),
+            df['close'].to_numpy(dtype=np.float64),
+            n,
+        ),
+        index=df.index,
+    )
 
 def sharpe(returns: pd.Series, rf: float = 0.0, periods_per_year: int = 365*24) -> float:
     # hourly frequency default